@@ -307,6 +307,15 @@ def on_doctype_update():
 	"""Add indexes in `tabCommunication`"""
 	frappe.db.add_index("Communication", ["reference_doctype", "reference_name"])
 	frappe.db.add_index("Communication", ["status", "communication_type"])
+	frappe.db.add_index("Communication", ["email_account"])
+	frappe.db.add_index("Communication", ["sent_or_received", "reference_doctype",
+		"unread_notification_sent", "creation"], "unreplied_communication_index")
+
+	# for threading replies on In-Reply-To, message_id is too long for a full index in MariaDB
+	if frappe.db.db_type == "postgres":
+		frappe.db.add_index("Communication", ["message_id"])
+	else:
+		frappe.db.add_index("Communication", ["message_id(140)"])
 
 def has_permission(doc, ptype, user):
 	if ptype=="read":
@@ -537,6 +537,7 @@ class File(Document):
 
 def on_doctype_update():
 	frappe.db.add_index("File", ["attached_to_doctype", "attached_to_name"])
+	frappe.db.add_index("File", ["content_hash"])
 
 def make_home_folder():
 	home = frappe.get_doc({
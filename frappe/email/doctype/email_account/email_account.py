@@ -6,8 +6,10 @@ import frappe
 import imaplib
 import re
 import json
+import hashlib
 import socket
 import time
+from six import iteritems
 from frappe import _
 from frappe.model.document import Document
 from frappe.utils import validate_email_address, cint, get_datetime, DATE_FORMAT, strip, comma_or, sanitize_html
@@ -27,12 +29,18 @@ from frappe.email.utils import get_port
 
 class SentEmailInInbox(Exception): pass
 
+# `<{id}@{domain}>` of Message-ID and In-Reply-To headers
+MESSAGE_ID_PATTERN = re.compile(r"^\s*<?([^@>\s]+)@([^>\s]+)>?\s*$")
+
+# characters replaced by spaces when making the account name from the email address
+NAME_SEPARATORS = {ord(c): " " for c in "_.-"}
+
 class EmailAccount(Document):
 	def autoname(self):
 		"""Set name as `email_account_name` or make title from Email Address."""
 		if not self.email_account_name:
 			self.email_account_name = self.email_id.split("@", 1)[0]\
-				.replace("_", " ").replace(".", " ").replace("-", " ").title()
+				.translate(NAME_SEPARATORS).title()
 
 		self.name = self.email_account_name
 
@@ -101,13 +109,17 @@ class EmailAccount(Document):
 			if not self.get(field):
 				continue
 
-			for email_account in frappe.get_all("Email Account", filters={ field: 1 }):
-				if email_account.name==self.name:
-					continue
+			other_defaults = [d.name for d in frappe.get_all("Email Account",
+				filters={ field: 1, "name": ("!=", self.name) })]
+			if not other_defaults:
+				continue
+
+			# only the flag changes, no need to validate (and connect to) the other accounts
+			frappe.db.sql("""update `tabEmail Account` set `{0}`=0, modified=%s
+				where name in %s""".format(field), (frappe.utils.now(), tuple(other_defaults)))
 
-				email_account = frappe.get_doc("Email Account", email_account.name)
-				email_account.set(field, 0)
-				email_account.save()
+			for name in other_defaults:
+				frappe.clear_document_cache("Email Account", name)
 
 	@frappe.whitelist()
 	def get_domain(self, email_id):
@@ -244,7 +256,7 @@ class EmailAccount(Document):
 
 		if self.enable_incoming:
 			uid_list = []
-			exceptions = []
+			failed = 0
 			seen_status = []
 			uid_reindexed = False
 			email_server = None
@@ -271,45 +283,88 @@ class EmailAccount(Document):
 				seen_status = emails.get("seen_status", [])
 				uid_reindexed = emails.get("uid_reindexed", False)
 
+			messages = []
 			for idx, msg in enumerate(incoming_mails):
 				uid = None if not uid_list else uid_list[idx]
-				try:
-					args = {
-						"uid": uid,
-						"seen": None if not seen_status else get_seen(seen_status.get(uid, None)),
-						"uid_reindexed": uid_reindexed
-					}
-					communication = self.insert_communication(msg, args=args)
+				messages.append((msg, {
+					"uid": uid,
+					"seen": None if not seen_status else get_seen(seen_status.get(uid, None)),
+					"uid_reindexed": uid_reindexed
+				}))
 
-				except SentEmailInInbox:
-					frappe.db.rollback()
+			batch_size = cint(frappe.conf.get("email_receive_batch_size")) or 50
+			for start in range(0, len(messages), batch_size):
+				failed += self.insert_batch(messages[start:start + batch_size])
 
-				except Exception:
-					frappe.db.rollback()
-					frappe.log_error('email_account.receive')
-					if self.use_imap:
-						self.handle_bad_emails(email_server, uid, msg, frappe.get_traceback())
-					exceptions.append(frappe.get_traceback())
+			#notify if user is linked to account
+			if len(incoming_mails)>0 and not frappe.local.flags.in_test:
+				frappe.publish_realtime('new_email', {"account":self.email_account_name, "number":len(incoming_mails)})
 
-				else:
-					frappe.db.commit()
-					if communication:
-						attachments = []
+			if failed:
+				raise Exception("{0} email(s) could not be received in Email Account {1}, see Error Log".format(
+					failed, self.name))
+
+	def insert_batch(self, messages):
+		"""Insert a batch of `(raw, args)` messages and commit once for the whole batch.
 
-						if hasattr(communication, '_attachments'):
-							attachments = [d.file_name for d in communication._attachments]
+		If any message in the batch fails, the batch is rolled back and retried
+		message by message so that only the bad emails are skipped. Returns
+		the number of failed messages."""
+		try:
+			communications, auto_replies = self.insert_communications_bulk(messages)
 
-						communication.notify(attachments=attachments, fetched_from_email_account=True)
+		except Exception:
+			frappe.db.rollback()
+			return self.insert_messages(messages)
 
-			#notify if user is linked to account
-			if len(incoming_mails)>0 and not frappe.local.flags.in_test:
-				frappe.publish_realtime('new_email', {"account":self.email_account_name, "number":len(incoming_mails)})
+		frappe.db.commit()
+		for communication in communications:
+			self.notify_communication(communication)
+
+		if auto_replies:
+			enqueue(send_auto_replies, 'short', now=frappe.flags.in_test, replies=auto_replies)
+
+		return 0
+
+	def insert_messages(self, messages):
+		"""Insert `(raw, args)` messages one by one, committing after each message.
+		Failures are logged in Error Log, returns the number of failed messages."""
+		failed = 0
+		for msg, args in messages:
+			try:
+				communication = self.insert_communication(msg, args=args)
+
+			except SentEmailInInbox:
+				frappe.db.rollback()
+
+			except Exception:
+				frappe.db.rollback()
+				traceback = frappe.get_traceback()
+				frappe.log_error(traceback, 'email_account.receive')
+				if self.use_imap:
+					self.handle_bad_emails(args.get("uid"), msg, traceback)
 
-			if exceptions:
-				raise Exception(frappe.as_json(exceptions))
+				# keep the log even if the job fails
+				frappe.db.commit()
+				failed += 1
 
-	def handle_bad_emails(self, email_server, uid, raw, reason):
-		if email_server and cint(email_server.settings.use_imap):
+			else:
+				frappe.db.commit()
+				self.notify_communication(communication)
+
+		return failed
+
+	def notify_communication(self, communication):
+		if communication:
+			attachments = []
+
+			if hasattr(communication, '_attachments'):
+				attachments = [d.file_name for d in communication._attachments]
+
+			communication.notify(attachments=attachments, fetched_from_email_account=True)
+
+	def handle_bad_emails(self, uid, raw, reason):
+		if cint(self.use_imap):
 			import email
 			try:
 				mail = email.message_from_string(raw)
@@ -324,12 +379,71 @@ class EmailAccount(Document):
 				"reason":reason,
 				"message_id": message_id,
 				"doctype": "Unhandled Email",
-				"email_account": email_server.settings.email_account
+				"email_account": self.name
 			})
 			unhandled_email.insert(ignore_permissions=True)
 			frappe.db.commit()
 
-	def insert_communication(self, msg, args=None):
+	def insert_communications_bulk(self, messages):
+		"""Insert Communications for a list of `(raw, args)` messages.
+
+		All emails are parsed first so that the lookups shared by the batch
+		(existing Message-IDs, users of this inbox) are made with one query each
+		instead of one query per email.
+
+		Returns the Communications and the `frappe.sendmail` arguments of the
+		auto replies to send once the batch is committed."""
+		emails = [Email(get_raw_message(msg)) for msg, args in messages]
+
+		self.receive_cache = frappe._dict(
+			auto_replies=[],
+			message_ids=self.get_existing_message_ids([email.message_id for email in emails]),
+			thread_parents=self.get_thread_parents([get_in_reply_to(email) for email in emails]))
+
+		if self.append_to:
+			# meta of `append_to` is the same for the whole batch
+			self.set_sender_field_and_subject_field()
+			self.receive_cache.append_to_fields_set = True
+
+		communications = []
+		try:
+			for (msg, args), email in zip(messages, emails):
+				try:
+					communications.append(self.insert_communication(msg, args=args, email=email))
+				except SentEmailInInbox:
+					pass
+
+			auto_replies = self.receive_cache.auto_replies
+		finally:
+			self.receive_cache = None
+
+		return communications, auto_replies
+
+	def get_existing_message_ids(self, message_ids):
+		"""Returns map of Message-ID to the latest Communication with that Message-ID."""
+		message_ids = tuple(set(filter(None, message_ids)))
+		if not message_ids:
+			return {}
+
+		return dict(frappe.db.sql("""SELECT `message_id`, `name` FROM `tabCommunication`
+			WHERE `message_id` in %s ORDER BY `creation`""", (message_ids,)))
+
+	def get_inbox_users(self):
+		"""Returns list of users that have this Email Account in their inbox."""
+		cache = getattr(self, "receive_cache", None)
+		if cache and cache.inbox_users is not None:
+			return cache.inbox_users
+
+		users = frappe.get_all("User Email", filters={ "email_account": self.name },
+			fields=["parent"])
+		users = list(set([ user.get("parent") for user in users ]))
+
+		if cache:
+			cache.inbox_users = users
+
+		return users
+
+	def insert_communication(self, msg, args=None, email=None):
 		if isinstance(msg, list):
 			raw, uid, seen = msg
 		else:
@@ -340,7 +454,8 @@ class EmailAccount(Document):
 			if args.get("uid", -1): uid = args.get("uid", -1)
 			if args.get("seen", 0): seen = args.get("seen", 0)
 
-		email = Email(raw)
+		email = email or Email(raw)
+		cache = getattr(self, "receive_cache", None)
 
 		if email.from_email == self.email_id and not email.mail.get("Reply-To"):
 			# gmail shows sent emails in inbox
@@ -351,15 +466,12 @@ class EmailAccount(Document):
 			raise SentEmailInInbox
 
 		if email.message_id:
-			# https://stackoverflow.com/a/18367248
-			names = frappe.db.sql("""SELECT DISTINCT `name`, `creation` FROM `tabCommunication`
-				WHERE `message_id`='{message_id}'
-				ORDER BY `creation` DESC LIMIT 1""".format(
-					message_id=email.message_id
-				), as_dict=True)
-
-			if names:
-				name = names[0].get("name")
+			if cache:
+				name = cache.message_ids.get(email.message_id)
+			else:
+				name = self.get_existing_message_ids([email.message_id]).get(email.message_id)
+
+			if name:
 				# email is already available update communication uid instead
 				frappe.db.set_value("Communication", name, "uid", uid, update_modified=False)
 				return frappe.get_doc("Communication", name)
@@ -381,6 +493,7 @@ class EmailAccount(Document):
 			"communication_medium": "Email",
 			"uid": int(uid or -1),
 			"message_id": email.message_id,
+			"thread_key": get_thread_key(email.subject, email.from_email),
 			"communication_date": email.date,
 			"has_attachment": 1 if email.attachments else 0,
 			"seen": seen or 0
@@ -389,14 +502,19 @@ class EmailAccount(Document):
 		self.set_thread(communication, email)
 		if communication.seen:
 			# get email account user and set communication as seen
-			users = frappe.get_all("User Email", filters={ "email_account": self.name },
-				fields=["parent"])
-			users = list(set([ user.get("parent") for user in users ]))
-			communication._seen = json.dumps(users)
+			communication._seen = json.dumps(self.get_inbox_users())
 
 		communication.flags.in_receive = True
 		communication.insert(ignore_permissions=True)
 
+		if cache and email.message_id:
+			# same email pulled twice in the batch, or replied to by a later email of the batch
+			cache.message_ids[email.message_id] = communication.name
+
+			parent_communication, parent_doctype, parent_name = get_communication_thread(communication)
+			cache.thread_parents[email.message_id] = (parent_communication,
+				frappe._dict(doctype=parent_doctype, name=parent_name))
+
 		# save attachments
 		communication._attachments = email.save_attachments_in_doc(communication)
 
@@ -415,7 +533,11 @@ class EmailAccount(Document):
 
 		# notify all participants of this thread
 		if self.enable_auto_reply and getattr(communication, "is_first", False):
-			self.send_auto_reply(communication, email)
+			if cache:
+				# queued together once the batch is committed
+				cache.auto_replies.append(self.get_auto_reply(communication, email))
+			else:
+				self.send_auto_reply(communication, email)
 
 		return communication
 
@@ -430,7 +552,8 @@ class EmailAccount(Document):
 
 		parent = self.find_parent_from_in_reply_to(communication, email)
 
-		if not parent and self.append_to:
+		cache = getattr(self, "receive_cache", None)
+		if not parent and self.append_to and not (cache and cache.append_to_fields_set):
 			self.set_sender_field_and_subject_field()
 
 		if not parent and self.append_to:
@@ -450,7 +573,8 @@ class EmailAccount(Document):
 				communication.unread_notification_sent = 1
 
 	def set_sender_field_and_subject_field(self):
-		'''Identify the sender and subject fields from the `append_to` DocType'''
+		'''Identify the sender and subject fields from the `append_to` DocType and
+		check if it links to an Email Account'''
 		# set subject_field and sender_field
 		meta_module = frappe.get_meta_module(self.append_to)
 		meta = frappe.get_meta(self.append_to)
@@ -463,6 +587,8 @@ class EmailAccount(Document):
 		if not meta.get_field(self.sender_field):
 			self.sender_field = None
 
+		self.append_to_has_email_account = meta.has_field("email_account")
+
 	def find_parent_based_on_subject_and_sender(self, communication, email):
 		'''Find parent document based on subject and sender match'''
 		parent = None
@@ -472,14 +598,24 @@ class EmailAccount(Document):
 				# try and match by subject and sender
 				# if sent by same sender with same subject,
 				# append it to old coversation
-				subject = frappe.as_unicode(strip(re.sub(r"(^\s*(fw|fwd|wg)[^:]*:|\s*(re|aw)[^:]*:\s*)*",
-					"", email.subject, 0, flags=re.IGNORECASE)))
+				subject = strip_reply_prefixes(email.subject)
 
-				parent = frappe.db.get_all(self.append_to, filters={
-					self.sender_field: email.from_email,
-					self.subject_field: ("like", "%{0}%".format(subject)),
+				# earlier email of the conversation, on the indexed thread key
+				parent = frappe.get_all("Communication", filters={
+					"thread_key": communication.thread_key or get_thread_key(email.subject, email.from_email),
+					"reference_doctype": self.append_to,
 					"creation": (">", (get_datetime() - relativedelta(days=60)).strftime(DATE_FORMAT))
-				}, fields="name")
+				}, fields=["reference_name as name"], order_by="creation desc", limit=1)
+
+				if parent and not frappe.db.exists(self.append_to, parent[0].name):
+					parent = None
+
+				if not parent:
+					parent = frappe.db.get_all(self.append_to, filters={
+						self.sender_field: email.from_email,
+						self.subject_field: ("like", "%{0}%".format(subject)),
+						"creation": (">", (get_datetime() - relativedelta(days=60)).strftime(DATE_FORMAT))
+					}, fields="name")
 
 				# match only subject field
 				# when the from_email is of a user in the system
@@ -507,7 +643,7 @@ class EmailAccount(Document):
 		if self.sender_field:
 			parent.set(self.sender_field, frappe.as_unicode(email.from_email))
 
-		if parent.meta.has_field("email_account"):
+		if self.append_to_has_email_account:
 			parent.email_account = self.name
 
 		parent.flags.ignore_mandatory = True
@@ -530,61 +666,105 @@ class EmailAccount(Document):
 	def find_parent_from_in_reply_to(self, communication, email):
 		'''Returns parent reference if embedded in In-Reply-To header
 
-		Message-ID is formatted as `{message_id}@{site}`'''
-		parent = None
-		in_reply_to = (email.mail.get("In-Reply-To") or "").strip(" <>")
-
-		if in_reply_to and "@{0}".format(frappe.local.site) in in_reply_to:
-			# reply to a communication sent from the system
-			email_queue = frappe.db.get_value('Email Queue', dict(message_id=in_reply_to), ['communication','reference_doctype', 'reference_name'])
-			if email_queue:
-				parent_communication, parent_doctype, parent_name = email_queue
-				if parent_communication:
-					communication.in_reply_to = parent_communication
-			else:
-				reference, domain = in_reply_to.split("@", 1)
-				parent_doctype, parent_name = 'Communication', reference
-
-			if frappe.db.exists(parent_doctype, parent_name):
-				parent = frappe._dict(doctype=parent_doctype, name=parent_name)
+		Message-ID is formatted as `{message_id}@{site}` for emails sent from this site,
+		replies to received emails are matched on the Message-ID of the Communication.
+		In both cases the parent is the reference of the replied Communication, or the
+		Communication itself if it has no reference.'''
+		in_reply_to = get_in_reply_to(email)
+		if not in_reply_to:
+			return None
 
-				# set in_reply_to of current communication
-				if parent_doctype=='Communication':
-					# communication.in_reply_to = email_queue.communication
+		cache = getattr(self, "receive_cache", None)
+		thread_parents = cache.thread_parents if cache else self.get_thread_parents([in_reply_to])
 
-					if parent.reference_name:
-						# the true parent is the communication parent
-						parent = frappe.get_doc(parent.reference_doctype,
-							parent.reference_name)
+		parent_communication, parent = thread_parents.get(in_reply_to) or (None, None)
+		if parent_communication:
+			communication.in_reply_to = parent_communication
 
 		return parent
 
+	def get_thread_parents(self, in_reply_to_list):
+		'''Returns map of In-Reply-To to `(parent communication, parent)`.
+		Makes one query per table for all the replies.'''
+		in_reply_to_list = tuple(set(filter(None, in_reply_to_list)))
+		if not in_reply_to_list:
+			return {}
+
+		# `{message_id}@{site}` of replies to emails sent from this site
+		site_replies = {}
+		for in_reply_to in in_reply_to_list:
+			# already parsed as `id@domain` by `get_in_reply_to`
+			message_id, domain = in_reply_to.split("@", 1)
+			if domain.startswith(frappe.local.site):
+				site_replies[in_reply_to] = message_id
+
+		references = {}
+		if site_replies:
+			for d in frappe.get_all("Email Queue", filters={"message_id": ("in", list(site_replies))},
+				fields=["message_id", "communication", "reference_doctype", "reference_name"]):
+				references[d.message_id] = (d.communication, d.reference_doctype, d.reference_name)
+
+		communications = dict((message_id, in_reply_to)
+			for in_reply_to, message_id in iteritems(site_replies) if in_reply_to not in references)
+
+		if communications:
+			for d in frappe.get_all("Communication", filters={"name": ("in", list(communications))},
+				fields=["name", "reference_doctype", "reference_name"]):
+				references[communications[d.name]] = get_communication_thread(d)
+
+		received_replies = tuple(in_reply_to for in_reply_to in in_reply_to_list
+			if in_reply_to not in references)
+
+		if received_replies:
+			# reply to a received email, `message_id` is indexed
+			for d in frappe.get_all("Communication", filters={"message_id": ("in", received_replies)},
+				fields=["message_id", "name", "reference_doctype", "reference_name"], order_by="creation"):
+				references[d.message_id] = get_communication_thread(d)
+
+		existing = get_existing_documents([(doctype, name) for c, doctype, name in references.values()])
+
+		thread_parents = {}
+		for in_reply_to, (parent_communication, parent_doctype, parent_name) in iteritems(references):
+			parent = None
+			if (parent_doctype, parent_name) in existing:
+				parent = frappe._dict(doctype=parent_doctype, name=parent_name)
+
+			thread_parents[in_reply_to] = (parent_communication, parent)
+
+		return thread_parents
+
 	def send_auto_reply(self, communication, email):
 		"""Send auto reply if set."""
 		if self.enable_auto_reply:
-			set_incoming_outgoing_accounts(communication)
+			frappe.sendmail(**self.get_auto_reply(communication, email))
 
-			if self.send_unsubscribe_message:
-				unsubscribe_message = _("Leave this conversation")
-			else:
-				unsubscribe_message = ""
-
-			frappe.sendmail(recipients = [email.from_email],
-				sender = self.email_id,
-				reply_to = communication.incoming_email_account,
-				subject = _("Re: ") + communication.subject,
-				content = render_template(self.auto_reply_message or "", communication.as_dict()) or \
-					 frappe.get_template("templates/emails/auto_reply.html").render(communication.as_dict()),
-				reference_doctype = communication.reference_doctype,
-				reference_name = communication.reference_name,
-				in_reply_to = email.mail.get("Message-Id"), # send back the Message-Id as In-Reply-To
-				unsubscribe_message = unsubscribe_message)
+	def get_auto_reply(self, communication, email):
+		"""Returns `frappe.sendmail` arguments for the auto reply to a received email."""
+		set_incoming_outgoing_accounts(communication)
+
+		if self.send_unsubscribe_message:
+			unsubscribe_message = _("Leave this conversation")
+		else:
+			unsubscribe_message = ""
+
+		args = communication.as_dict()
+		content = render_template(self.auto_reply_message or "", args) or \
+			frappe.get_template("templates/emails/auto_reply.html").render(args)
+
+		return dict(recipients = [email.from_email],
+			sender = self.email_id,
+			reply_to = communication.incoming_email_account,
+			subject = _("Re: ") + communication.subject,
+			content = content,
+			reference_doctype = communication.reference_doctype,
+			reference_name = communication.reference_name,
+			in_reply_to = email.mail.get("Message-Id"), # send back the Message-Id as In-Reply-To
+			unsubscribe_message = unsubscribe_message)
 
 	def get_unreplied_notification_emails(self):
 		"""Return list of emails listed"""
 		self.send_notification_to = self.send_notification_to.replace(",", "\n")
-		out = [e.strip() for e in self.send_notification_to.split("\n") if e.strip()]
-		return out
+		return get_unreplied_notification_emails(self.send_notification_to)
 
 	def on_trash(self):
 		"""Clear communications where email account is linked"""
@@ -667,12 +847,61 @@ class EmailAccount(Document):
 		if not email_server:
 			return
 
-		email_server.connect()
+		if not email_server.is_connected():
+			email_server.connect()
 
 		if email_server.imap:
 			email_server.imap.append("Sent", "\\Seen", imaplib.Time2Internaldate(time.time()), message)
 
 
+def get_raw_message(msg):
+	"""Returns the raw email from a message that may be a `[raw, uid, seen]` list."""
+	return msg[0] if isinstance(msg, list) else msg
+
+def get_in_reply_to(email):
+	"""Returns In-Reply-To of the email as `id@domain`, None if it is not a Message-ID."""
+	message_id, domain = parse_message_id(email.mail.get("In-Reply-To"))
+	return "{0}@{1}".format(message_id, domain) if message_id else None
+
+def get_communication_thread(communication):
+	"""Returns `(communication, parent doctype, parent name)` for a reply to the communication.
+	The parent is the reference of the communication, or the communication itself if it has none."""
+	if communication.reference_doctype and communication.reference_name:
+		return (communication.name, communication.reference_doctype, communication.reference_name)
+
+	return (communication.name, "Communication", communication.name)
+
+def strip_reply_prefixes(subject):
+	"""Returns subject without the `Re:`, `Fwd:` etc. prefixes."""
+	return frappe.as_unicode(strip(re.sub(r"(^\s*(fw|fwd|wg)[^:]*:|\s*(re|aw)[^:]*:\s*)*",
+		"", subject, 0, flags=re.IGNORECASE)))
+
+def get_thread_key(subject, sender):
+	"""Returns a short hash of the subject (without reply prefixes) and sender. It is
+	indexed on Communication, to find earlier emails of a conversation that has
+	no In-Reply-To without matching the subject with `like`."""
+	key = "{0}|{1}".format(strip_reply_prefixes(subject or "").lower(), (sender or "").lower())
+	return hashlib.sha1(frappe.safe_encode(key)).hexdigest()[:16]
+
+def parse_message_id(message_id):
+	"""Returns `(id, domain)` of a Message-ID, `(None, None)` if it is not formatted as `id@domain`."""
+	match = MESSAGE_ID_PATTERN.match(message_id or "")
+	return match.groups() if match else (None, None)
+
+def get_existing_documents(references):
+	"""Returns set of `(doctype, name)` in `references` that exist, with one query per doctype."""
+	names_by_doctype = {}
+	for doctype, name in references:
+		if doctype and name:
+			names_by_doctype.setdefault(doctype, set()).add(name)
+
+	existing = set()
+	for doctype, names in iteritems(names_by_doctype):
+		existing.update((doctype, d.name) for d in frappe.get_all(doctype,
+			filters={"name": ("in", list(names))}))
+
+	return existing
+
 @frappe.whitelist()
 def get_append_to(doctype=None, txt=None, searchfield=None, start=None, page_len=None, filters=None):
 	if not txt: txt = ""
@@ -697,29 +926,47 @@ def notify_unreplied():
 	"""Sends email notifications if there are unreplied Communications
 		and `notify_if_unreplied` is set as true."""
 
-	for email_account in frappe.get_all("Email Account", "name", filters={"enable_incoming": 1, "notify_if_unreplied": 1}):
-		email_account = frappe.get_doc("Email Account", email_account.name)
+	now = datetime.now()
+	for email_account in frappe.get_all("Email Account", filters={"enable_incoming": 1, "notify_if_unreplied": 1},
+		fields=["name", "append_to", "unreplied_for_mins", "send_notification_to"]):
 		if email_account.append_to:
+			unreplied_for = timedelta(seconds = (email_account.unreplied_for_mins or 30) * 60)
 
 			# get open communications younger than x mins, for given doctype
-			for comm in frappe.get_all("Communication", "name", filters=[
+			# "between" is not used as it rounds the range to whole days
+			communications = frappe.get_all("Communication",
+				fields=["name", "subject", "content", "reference_doctype", "reference_name"], filters=[
 					{"sent_or_received": "Received"},
 					{"reference_doctype": email_account.append_to},
 					{"unread_notification_sent": 0},
 					{"email_account":email_account.name},
-					{"creation": ("<", datetime.now() - timedelta(seconds = (email_account.unreplied_for_mins or 30) * 60))},
-					{"creation": (">", datetime.now() - timedelta(seconds = (email_account.unreplied_for_mins or 30) * 60 * 3))}
-				]):
-				comm = frappe.get_doc("Communication", comm.name)
-
-				if frappe.db.get_value(comm.reference_doctype, comm.reference_name, "status")=="Open":
-					# if status is still open
-					frappe.sendmail(recipients=email_account.get_unreplied_notification_emails(),
+					{"creation": ("<", now - unreplied_for)},
+					{"creation": (">", now - unreplied_for * 3)}
+				])
+
+			if not communications:
+				continue
+
+			# references with status still open
+			open_references = set(d.name for d in frappe.get_all(email_account.append_to, filters={
+				"name": ("in", list(set(comm.reference_name for comm in communications))),
+				"status": "Open"
+			}))
+
+			recipients = get_unreplied_notification_emails(email_account.send_notification_to)
+			for comm in communications:
+				if comm.reference_name in open_references:
+					frappe.sendmail(recipients=recipients,
 						content=comm.content, subject=comm.subject, doctype= comm.reference_doctype,
 						name=comm.reference_name)
 
-				# update flag
-				comm.db_set("unread_notification_sent", 1)
+			# update flag
+			frappe.db.sql("""update `tabCommunication` set unread_notification_sent=1
+				where name in %s""", (tuple(comm.name for comm in communications),))
+
+def get_unreplied_notification_emails(send_notification_to):
+	"""Return list of emails in `send_notification_to`, separated by comma or newline"""
+	return [e.strip() for e in (send_notification_to or "").replace(",", "\n").split("\n") if e.strip()]
 
 def pull(now=False):
 	"""Will be called via scheduler, pull emails from all enabled Email accounts."""
@@ -750,6 +997,18 @@ def pull_from_email_account(email_account):
 	# mark Email Flag Queue mail as read
 	email_account.mark_emails_as_read_unread()
 
+def send_auto_replies(replies):
+	'''Runs within a worker process, queues the auto replies to a batch of received emails'''
+	for reply in replies:
+		try:
+			frappe.sendmail(**reply)
+		except Exception:
+			# discard the partial Email Queue of this reply, the others are still sent
+			frappe.db.rollback()
+			frappe.log_error(frappe.get_traceback(), 'email_account.send_auto_replies')
+		else:
+			frappe.db.commit()
+
 def get_max_email_uid(email_account):
 	# get maximum uid of emails
 	max_uid = 1
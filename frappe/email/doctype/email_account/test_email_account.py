@@ -9,7 +9,7 @@ test_records = frappe.get_test_records('Email Account')
 
 from frappe.core.doctype.communication.email import make
 from frappe.desk.form.load import get_attachments
-from frappe.email.doctype.email_account.email_account import notify_unreplied
+from frappe.email.doctype.email_account.email_account import notify_unreplied, parse_message_id
 from datetime import datetime, timedelta
 
 class TestEmailAccount(unittest.TestCase):
@@ -168,6 +168,49 @@ class TestEmailAccount(unittest.TestCase):
 		self.assertEqual(comm_list[0].reference_doctype, comm_list[1].reference_doctype)
 		self.assertEqual(comm_list[0].reference_name, comm_list[1].reference_name)
 
+	def test_threading_by_subject_in_separate_pulls(self):
+		cleanup(["in", ['test_sender@example.com', 'test@example.com']])
+		email_account = frappe.get_doc("Email Account", "_Test Email Account 1")
+
+		with open(os.path.join(os.path.dirname(__file__), "test_mails", "reply-2.raw"), "r") as f:
+			email_account.receive(test_mails=[f.read()])
+
+		# parent no longer matches the subject, only the thread key of the first email does
+		first = frappe.get_doc("Communication", {"sender": "test_sender@example.com"})
+		frappe.db.set_value(first.reference_doctype, first.reference_name, "description", "changed description")
+
+		# reply without In-Reply-To is pulled after the first email is received
+		with open(os.path.join(os.path.dirname(__file__), "test_mails", "reply-3.raw"), "r") as f:
+			email_account.receive(test_mails=[f.read()])
+
+		comm_list = frappe.get_all("Communication", filters={"sender":"test_sender@example.com"},
+			fields=["name", "reference_doctype", "reference_name"])
+
+		self.assertEqual(len(comm_list), 2)
+		self.assertEqual(comm_list[0].reference_doctype, comm_list[1].reference_doctype)
+		self.assertEqual(comm_list[0].reference_name, comm_list[1].reference_name)
+
+	def test_threading_by_received_message_id(self):
+		cleanup(["in", ['test_sender@example.com', 'test@example.com']])
+		email_account = frappe.get_doc("Email Account", "_Test Email Account 1")
+
+		with open(os.path.join(os.path.dirname(__file__), "test_mails", "reply-4.raw"), "r") as f:
+			raw = f.read()
+
+		email_account.receive(test_mails=[raw.replace('{{ message_id }}', '<unknown-thread@example.com>')])
+		received = frappe.get_doc("Communication", {"sender": "test_sender@example.com"})
+
+		# reply to the received email, with a different subject
+		reply = raw.replace('{{ message_id }}', '<{0}>'.format(received.message_id))
+		reply = reply.replace('07D687F6-10AA-4B9F-82DE-27753096164E', 'reply-to-received')
+		reply = reply.replace('Re: What did you work on today?', 'Re: Reply to a received email')
+		email_account.receive(test_mails=[reply])
+
+		comm = frappe.get_doc("Communication", {"message_id": "reply-to-received@gmail.com"})
+		self.assertEqual(comm.in_reply_to, received.name)
+		self.assertEqual(comm.reference_doctype, received.reference_doctype)
+		self.assertEqual(comm.reference_name, received.reference_name)
+
 	def test_threading_by_message_id(self):
 		cleanup()
 		frappe.db.sql("""delete from `tabEmail Queue`""")
@@ -196,6 +239,12 @@ class TestEmailAccount(unittest.TestCase):
 		self.assertEqual(comm_list[0].reference_doctype, event.doctype)
 		self.assertEqual(comm_list[0].reference_name, event.name)
 
+	def test_parse_message_id(self):
+		self.assertEqual(parse_message_id("<abc123@example.com>"), ("abc123", "example.com"))
+		self.assertEqual(parse_message_id(" abc123@example.com "), ("abc123", "example.com"))
+		self.assertEqual(parse_message_id("abc123"), (None, None))
+		self.assertEqual(parse_message_id(None), (None, None))
+
 def cleanup(sender=None):
 	filters = {}
 	if sender:
@@ -5,7 +5,7 @@ from __future__ import unicode_literals
 import six
 from six import iteritems, text_type
 from six.moves import range
-import time, _socket, poplib, imaplib, email, email.utils, datetime, chardet, re
+import time, _socket, poplib, imaplib, email, email.utils, datetime, chardet, re, binascii
 from email_reply_parser import EmailReplyParser
 from email.header import decode_header
 import frappe
@@ -43,6 +43,23 @@ class EmailServer:
 		else:
 			return self.connect_pop()
 
+	def is_connected(self):
+		"""Returns True if the connection made earlier (e.g. while validating the account
+		in `get_incoming_server`) is still alive, so that it can be reused instead of
+		connecting and logging in again."""
+		try:
+			if cint(self.settings.use_imap):
+				if getattr(self, "imap", None):
+					self.imap.noop()
+					return True
+			elif getattr(self, "pop", None):
+				self.pop.noop()
+				return True
+		except Exception:
+			pass
+
+		return False
+
 	def connect_imap(self):
 		"""Connect to IMAP"""
 		try:
@@ -100,7 +117,7 @@ class EmailServer:
 
 		frappe.db.commit()
 
-		if not self.connect():
+		if not self.is_connected() and not self.connect():
 			return
 
 		uid_list = []
@@ -111,6 +128,7 @@ class EmailServer:
 			self.latest_messages = []
 			self.seen_status = {}
 			self.uid_reindexed = False
+			self.pop_pipeline_broken = False
 
 			uid_list = email_list = self.get_new_mails()
 
@@ -127,15 +145,21 @@ class EmailServer:
 			self.max_email_size = cint(frappe.local.conf.get("max_email_size"))
 			self.max_total_size = 5 * self.max_email_size
 
-			for i, message_meta in enumerate(email_list):
-				# do not pull more than NUM emails
-				if (i+1) > num:
-					break
-
+			if cint(self.settings.use_imap):
+				for i, message_meta in enumerate(email_list):
+					# do not pull more than NUM emails
+					if (i+1) > num:
+						break
+
+					try:
+						self.retrieve_message(message_meta, i+1)
+					except (TotalSizeExceededError, EmailTimeoutError, LoginLimitExceeded):
+						break
+			else:
 				try:
-					self.retrieve_message(message_meta, i+1)
-				except (TotalSizeExceededError, EmailTimeoutError, LoginLimitExceeded):
-					break
+					self.retrieve_pop_messages(email_list[:num])
+				except (TotalSizeExceededError, LoginLimitExceeded):
+					pass
 			# WARNING: Mark as read - message number 101 onwards from the pop list
 			# This is to avoid having too many messages entering the system
 			num = num_copy
@@ -155,6 +179,8 @@ class EmailServer:
 			# no matter the exception, pop should quit if connected
 			if cint(self.settings.use_imap):
 				self.imap.logout()
+			elif self.pop_pipeline_broken:
+				self.close_pop()
 			else:
 				self.pop.quit()
 
@@ -272,6 +298,113 @@ class EmailServer:
 				if self.settings.email_sync_rule == "UNSEEN":
 					self.imap.uid('STORE', message_meta, '+FLAGS', '(\\SEEN)')
 
+	def retrieve_pop_messages(self, email_list):
+		"""Retrieve POP3 messages by pipelining `RETR` and `DELE` commands.
+
+		Commands are sent in windows of `pop3_pipeline_window` (site config, default 10)
+		messages and their responses are read back afterwards, so a pull costs one
+		round-trip per window instead of one per message. Servers that do not advertise
+		the `PIPELINING` capability (RFC 2449) get one command at a time."""
+		if self.has_pop_pipelining():
+			window = cint(frappe.conf.get("pop3_pipeline_window")) or 10
+		else:
+			window = 1
+
+		for start in range(0, len(email_list), window):
+			msg_nums, to_delete = [], []
+			total_size_exceeded = False
+
+			for msg_num, message_meta in enumerate(email_list[start:start + window], start + 1):
+				try:
+					self.validate_message_limits(message_meta)
+				except TotalSizeExceededError:
+					# retrieve the messages validated so far, then stop
+					self.errors = True
+					total_size_exceeded = True
+					break
+				except EmailSizeExceededError:
+					frappe.log_error("receive.get_messages", self.make_error_msg(msg_num, None))
+					self.errors = True
+					to_delete.append(msg_num)
+				else:
+					msg_nums.append(msg_num)
+
+			for msg_num in msg_nums:
+				self.pop._putcmd("RETR {0}".format(msg_num))
+
+			for i, msg_num in enumerate(msg_nums):
+				try:
+					resp = self.pop._getline()[0]
+					if resp.startswith(b'+'):
+						self.latest_messages.append(b'\n'.join(self.get_pop_multiline()))
+						to_delete.append(msg_num)
+						continue
+
+				except EmailTimeoutError:
+					# responses for the rest of the window are still unread
+					self.errors = True
+					self.pop_pipeline_broken = True
+					return
+
+				except Exception:
+					# failed in the middle of a response, the next lines can not be matched to a message
+					self.errors = True
+					self.pop_pipeline_broken = True
+					raise
+
+				# `-ERR` status for this message only, the other responses are still in sync
+				error = poplib.error_proto(cstr(resp))
+				self.errors = True
+				if self.has_login_limit_exceeded(error):
+					self.pop_pipeline_broken = i < len(msg_nums) - 1
+					raise LoginLimitExceeded(error)
+
+				frappe.log_error("receive.get_messages", "Error in retrieving email.\n{0}".format(cstr(resp)))
+				to_delete.append(msg_num)
+
+			self.delete_pop_messages(to_delete)
+
+			if total_size_exceeded:
+				raise TotalSizeExceededError
+
+	def has_pop_pipelining(self):
+		"""Returns True if the POP3 server advertises the `PIPELINING` capability."""
+		try:
+			return "PIPELINING" in self.pop.capa()
+		except poplib.error_proto:
+			# server does not support `CAPA`
+			return False
+
+	def get_pop_multiline(self):
+		"""Returns the lines of a multi-line POP3 response, read after its status line."""
+		lines = []
+		line = self.pop._getline()[0]
+		while line != b'.':
+			if line.startswith(b'..'):
+				line = line[1:]
+			lines.append(line)
+			line = self.pop._getline()[0]
+
+		return lines
+
+	def delete_pop_messages(self, msg_nums):
+		"""Pipeline `DELE` for the given message numbers."""
+		for msg_num in msg_nums:
+			self.pop._putcmd("DELE {0}".format(msg_num))
+
+		for msg_num in msg_nums:
+			self.pop._getresp()
+
+	def close_pop(self):
+		"""Drop the POP3 connection without `QUIT` when pipelined responses are left unread.
+
+		The server does not expunge messages marked for deletion in this case, they are pulled
+		again on the next run and matched to the existing Communication by Message-ID."""
+		if hasattr(self.pop, "close"):
+			self.pop.close()
+		else:
+			self.pop.sock.close()
+
 	def get_email_seen_status(self, uid, flag_string):
 		""" parse the email FLAGS response """
 		if not flag_string:
@@ -289,7 +422,7 @@ class EmailServer:
 			self.seen_status.update({ uid: "UNSEEN" })
 
 	def has_login_limit_exceeded(self, e):
-		return "-ERR Exceeded the login limit" in strip(cstr(e.message))
+		return "-ERR Exceeded the login limit" in strip(cstr(e))
 
 	def is_temporary_system_problem(self, e):
 		messages = (
@@ -476,25 +609,28 @@ class Email:
 			self.text_content += text_content
 			self.html_content += markdown(text_content)
 
-	def get_charset(self, part):
-		"""Detect chartset."""
+	def get_charset(self, part, payload=None):
+		"""Detect chartset, from the decoded payload if it is not declared."""
 		charset = part.get_content_charset()
 		if not charset:
-			charset = chardet.detect(safe_encode(cstr(part)))['encoding']
+			if payload is None:
+				payload = part.get_payload(decode=True)
+			charset = chardet.detect(payload or b"")['encoding']
 
 		return charset
 
 	def get_payload(self, part):
-		charset = self.get_charset(part)
+		payload = part.get_payload(decode=True)
+		charset = self.get_charset(part, payload)
 
 		try:
-			return text_type(part.get_payload(decode=True), str(charset), "ignore")
+			return text_type(payload, str(charset), "ignore")
 		except LookupError:
 			return part.get_payload()
 
 	def get_attachment(self, part):
 		#charset = self.get_charset(part)
-		fcontent = part.get_payload(decode=True)
+		fcontent = get_attachment_content(part)
 
 		if fcontent:
 			content_type = part.get_content_type()
@@ -521,6 +657,11 @@ class Email:
 	def save_attachments_in_doc(self, doc):
 		"""Save email attachments in given document."""
 		saved_attachments = []
+		if not self.attachments:
+			return saved_attachments
+
+		# same for all attachments, set here instead of being looked up for each File
+		folder = frappe.db.get_value("File", {"is_attachments_folder": 1})
 
 		for attachment in self.attachments:
 			try:
@@ -529,6 +670,7 @@ class Email:
 					"file_name": attachment['fname'],
 					"attached_to_doctype": doc.doctype,
 					"attached_to_name": doc.name,
+					"folder": folder,
 					"is_private": 1,
 					"content": attachment['fcontent']})
 				_file.save()
@@ -552,6 +694,34 @@ class Email:
 		return l and l[0] or None
 
 
+def get_attachment_content(part, chunk_size=65536):
+	"""Returns decoded content of an attachment `part`.
+
+	Base64 payloads are decoded in chunks of `chunk_size` characters into a `bytearray`,
+	which is returned as is, so that neither the whole encoded payload without line
+	breaks nor a second decoded copy is made."""
+	if part.is_multipart() or cstr(part.get("Content-Transfer-Encoding")).strip().lower() != "base64":
+		return part.get_payload(decode=True)
+
+	payload = part.get_payload()
+	content = bytearray()
+	remainder = ""
+	try:
+		for start in range(0, len(payload), chunk_size):
+			chunk = remainder + "".join(payload[start:start + chunk_size].split())
+			end = len(chunk) - len(chunk) % 4
+			content.extend(binascii.a2b_base64(chunk[:end]))
+			remainder = chunk[end:]
+
+	except (binascii.Error, ValueError):
+		remainder = True
+
+	if remainder:
+		# malformed base64, let the email package handle the defects
+		return part.get_payload(decode=True)
+
+	return content
+
 # fix due to a python bug in poplib that limits it to 2048
 poplib._MAXLINE = 20480
 imaplib._MAXLINE = 20480
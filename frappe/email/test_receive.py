@@ -0,0 +1,135 @@
+# Copyright (c) 2019, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+from __future__ import unicode_literals
+
+import unittest, poplib, base64
+import frappe
+from email.mime.application import MIMEApplication
+from frappe.email.receive import (EmailServer, TotalSizeExceededError, LoginLimitExceeded,
+	get_attachment_content)
+
+
+class FakePOP(object):
+	"""Records pipelined commands and replays the given response lines."""
+	def __init__(self, lines, capabilities=("PIPELINING",)):
+		self.lines = list(lines)
+		self.commands = []
+		self.capabilities = capabilities
+
+	def capa(self):
+		if self.capabilities is None:
+			raise poplib.error_proto('-ERR unknown command')
+		return dict((c, []) for c in self.capabilities)
+
+	def _putcmd(self, line):
+		self.commands.append(line)
+
+	def _getline(self):
+		if not self.lines:
+			raise poplib.error_proto('-ERR EOF')
+		line = self.lines.pop(0)
+		return line, len(line)
+
+	def _getresp(self):
+		resp = self._getline()[0]
+		if not resp.startswith(b'+'):
+			raise poplib.error_proto(resp)
+		return resp
+
+
+class TestPOPPipelining(unittest.TestCase):
+	def get_server(self, lines, max_email_size=0, capabilities=("PIPELINING",)):
+		server = EmailServer(frappe._dict(use_imap=0))
+		server.pop = FakePOP(lines, capabilities)
+		server.latest_messages = []
+		server.errors = False
+		server.pop_pipeline_broken = False
+		server.total_size = 0
+		server.max_email_size = max_email_size
+		server.max_total_size = 250
+		return server
+
+	def test_retrieve_and_delete(self):
+		server = self.get_server([
+			b'+OK', b'Subject: one', b'', b'..dot stuffed', b'.',
+			b'-ERR no such message',
+			b'+OK', b'Subject: three', b'.',
+			b'+OK', b'+OK', b'+OK'
+		])
+		server.retrieve_pop_messages(["1 100", "2 100", "3 100"])
+
+		self.assertEqual(server.pop.commands, ["RETR 1", "RETR 2", "RETR 3",
+			"DELE 1", "DELE 2", "DELE 3"])
+		self.assertEqual(server.latest_messages, [b'Subject: one\n\n.dot stuffed', b'Subject: three'])
+		self.assertTrue(server.errors)
+		self.assertFalse(server.pop_pipeline_broken)
+		self.assertFalse(server.pop.lines)
+
+	def test_without_pipelining_capability(self):
+		for capabilities in ((), None):
+			server = self.get_server([
+				b'+OK', b'Subject: one', b'.', b'+OK',
+				b'+OK', b'Subject: two', b'.', b'+OK'
+			], capabilities=capabilities)
+			server.retrieve_pop_messages(["1 100", "2 100"])
+
+			# one command at a time
+			self.assertEqual(server.pop.commands, ["RETR 1", "DELE 1", "RETR 2", "DELE 2"])
+			self.assertEqual(server.latest_messages, [b'Subject: one', b'Subject: two'])
+			self.assertFalse(server.pop.lines)
+
+	def test_failure_inside_response(self):
+		# connection drops in the middle of the first message
+		server = self.get_server([b'+OK', b'Subject: one'])
+
+		self.assertRaises(poplib.error_proto, server.retrieve_pop_messages, ["1 100", "2 100"])
+		self.assertTrue(server.pop_pipeline_broken)
+		self.assertEqual(server.pop.commands, ["RETR 1", "RETR 2"])
+		self.assertEqual(server.latest_messages, [])
+
+	def test_login_limit_exceeded(self):
+		server = self.get_server([b'-ERR Exceeded the login limit', b'+OK', b'.'])
+
+		self.assertRaises(LoginLimitExceeded, server.retrieve_pop_messages, ["1 100", "2 100"])
+		# response of the second message is still unread
+		self.assertTrue(server.pop_pipeline_broken)
+		self.assertEqual(server.pop.commands, ["RETR 1", "RETR 2"])
+
+	def test_total_size_exceeded(self):
+		server = self.get_server([
+			b'+OK', b'Subject: one', b'.',
+			b'+OK', b'Subject: two', b'.',
+			b'+OK', b'+OK'
+		], max_email_size=200)
+
+		self.assertRaises(TotalSizeExceededError, server.retrieve_pop_messages, ["1 100", "2 100", "3 100"])
+
+		# messages validated before the size limit are still retrieved
+		self.assertEqual(server.pop.commands, ["RETR 1", "RETR 2", "DELE 1", "DELE 2"])
+		self.assertEqual(server.latest_messages, [b'Subject: one', b'Subject: two'])
+		self.assertFalse(server.pop_pipeline_broken)
+
+
+class TestAttachmentContent(unittest.TestCase):
+	def get_part(self, payload):
+		part = MIMEApplication(b"", _encoder=lambda part: None)
+		part["Content-Transfer-Encoding"] = "base64"
+		part.set_payload(payload)
+		return part
+
+	def assertSameContent(self, part):
+		for chunk_size in (7, 64, 65536):
+			self.assertEqual(bytes(get_attachment_content(part, chunk_size=chunk_size)),
+				part.get_payload(decode=True))
+
+	def test_base64(self):
+		self.assertSameContent(MIMEApplication(bytes(bytearray(range(256))) * 20))
+
+	def test_crlf_line_breaks(self):
+		encoded = base64.encodebytes(bytes(bytearray(range(256))) * 20).decode()
+		self.assertSameContent(self.get_part(encoded.replace("\n", "\r\n")))
+
+	def test_malformed_base64(self):
+		encoded = base64.b64encode(b"malformed attachment").decode()
+		self.assertSameContent(self.get_part(encoded[:-3]))
+		self.assertSameContent(self.get_part(encoded[:8] + "*%" + encoded[8:]))
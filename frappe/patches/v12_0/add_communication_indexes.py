@@ -0,0 +1,13 @@
+import frappe
+
+def execute():
+	# indexes used while receiving emails, clearing an email account and notifying unreplied emails
+	frappe.db.add_index("Communication", ["email_account"])
+	frappe.db.add_index("Communication", ["sent_or_received", "reference_doctype",
+		"unread_notification_sent", "creation"], "unreplied_communication_index")
+
+	# message_id is too long for a full index in MariaDB
+	if frappe.db.db_type == "postgres":
+		frappe.db.add_index("Communication", ["message_id"])
+	else:
+		frappe.db.add_index("Communication", ["message_id(140)"])
@@ -0,0 +1,5 @@
+import frappe
+
+def execute():
+	# lookup of duplicate files when saving attachments
+	frappe.db.add_index("File", ["content_hash"])
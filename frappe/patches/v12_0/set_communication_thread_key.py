@@ -0,0 +1,24 @@
+import frappe
+from dateutil.relativedelta import relativedelta
+from frappe.utils import get_datetime, DATE_FORMAT
+from frappe.email.doctype.email_account.email_account import get_thread_key
+
+def execute():
+	frappe.reload_doc("core", "doctype", "communication")
+
+	# emails are threaded on the thread key of the last 60 days
+	communications = frappe.get_all("Communication", filters={
+		"sent_or_received": "Received",
+		"communication_medium": "Email",
+		"reference_doctype": ("is", "set"),
+		"thread_key": ("is", "not set"),
+		"creation": (">", (get_datetime() - relativedelta(days=60)).strftime(DATE_FORMAT))
+	}, fields=["name", "subject", "sender"])
+
+	names_by_key = {}
+	for d in communications:
+		names_by_key.setdefault(get_thread_key(d.subject, d.sender), []).append(d.name)
+
+	for thread_key, names in names_by_key.items():
+		frappe.db.sql("""update `tabCommunication` set thread_key=%s
+			where name in %s""", (thread_key, tuple(names)))
@@ -15,7 +15,7 @@ from num2words import num2words
 from six.moves import html_parser as HTMLParser
 from six.moves.urllib.parse import quote, urljoin
 from html2text import html2text
-from markdown2 import markdown, MarkdownError
+from markdown2 import Markdown, MarkdownError
 from six import iteritems, text_type, string_types, integer_types
 
 DATE_FORMAT = "%Y-%m-%d"
@@ -1062,25 +1062,31 @@ def to_markdown(html):
 	return text
 
 def md_to_html(markdown_text):
-	extras = {
-		'fenced-code-blocks': None,
-		'tables': None,
-		'header-ids': None,
-		'highlightjs-lang': None,
-		'html-classes': {
-			'table': 'table table-bordered',
-			'img': 'screenshot'
-		}
-	}
-
 	html = None
 	try:
-		html = markdown(markdown_text or '', extras=extras)
+		html = _get_markdown_renderer().convert(markdown_text or '')
 	except MarkdownError:
 		pass
 
 	return html
 
+def _get_markdown_renderer():
+	"""Returns a `Markdown` instance configured with the extras, reused for every conversion
+	(`convert` resets its state) instead of setting up a new one for each text."""
+	if not getattr(frappe.local, 'markdown_renderer', None):
+		frappe.local.markdown_renderer = Markdown(extras={
+			'fenced-code-blocks': None,
+			'tables': None,
+			'header-ids': None,
+			'highlightjs-lang': None,
+			'html-classes': {
+				'table': 'table table-bordered',
+				'img': 'screenshot'
+			}
+		})
+
+	return frappe.local.markdown_renderer
+
 def get_source_value(source, key):
 	'''Get value from source (object or dict) based on key'''
 	if isinstance(source, dict):
@@ -25,6 +25,21 @@ def get_jenv():
 def get_template(path):
 	return get_jenv().get_template(path)
 
+def get_string_template(template):
+	"""Returns `template` compiled by the Jinja environment. Compiled templates are cached
+	on the environment, so the same string (e.g. an auto reply message) is compiled once."""
+	jenv = get_jenv()
+	string_templates = getattr(jenv, "string_templates", None)
+	if string_templates is None:
+		string_templates = jenv.string_templates = {}
+
+	if template not in string_templates:
+		if len(string_templates) >= 256:
+			string_templates.clear()
+		string_templates[template] = jenv.from_string(template)
+
+	return string_templates[template]
+
 def get_email_from_template(name, args):
 	from jinja2 import TemplateNotFound
 
@@ -77,7 +92,7 @@ def render_template(template, context, is_path=None, safe_render=True):
 		if safe_render and ".__" in template:
 			throw("Illegal template")
 		try:
-			return get_jenv().from_string(template).render(context)
+			return get_string_template(template).render(context)
 		except TemplateError:
 			throw(title="Jinja Template Error", msg="<pre>{template}</pre><pre>{tb}</pre>".format(template=template, tb=get_traceback()))
 